@@ -15,14 +15,177 @@ The module follows a modular design pattern for maximum flexibility:
 1. prepare_prompt(): Structures data for optimal AI processing
 2. invoke_claude_model(): Handles API communication with Bedrock
 3. extract_narrative_claude(): Processes the AI response
+   (stream_narrative_claude() yields it incrementally from a streamed response)
 4. generate_fallback_narrative(): Ensures reliability when AI fails
 
+Async callers can use agenerate_narrative() / ainvoke_claude_model(), which use
+aioboto3 when it is installed so the Bedrock round-trip does not block the event loop.
+
 Author: Security Engineering Team
 Last Updated: 2025-04-01
 """
 
-import json  # For parsing and formatting API requests/responses
+import asyncio  # For non-blocking Bedrock calls from async hosts
+import concurrent.futures  # For running several Bedrock calls in parallel threads
+import heapq  # For picking the most severe findings without a full sort
+import io  # For building the prompt in a single buffer
+import json  # For formatting debug previews of API requests/responses
+import logging  # For optional debug previews of Bedrock traffic
+import os  # For environment variable access
+import re  # For splitting batched multi-account responses
+from collections import defaultdict  # For grouping findings by category
+from operator import itemgetter  # For a C-level sort key on (rank, finding) pairs
 import boto3  # AWS SDK for Python to interact with Amazon Bedrock
+from botocore.config import Config  # Retry and connection pool settings
+
+# aioboto3 is optional - without it the async entry points run the
+# synchronous boto3 client in a worker thread instead
+try:
+    import aioboto3
+except ImportError:
+    aioboto3 = None
+
+# Bedrock model to invoke - Claude 3 Haiku unless overridden with the
+# BEDROCK_MODEL_ID environment variable (a model ID or inference profile ID)
+MODEL_ID = os.environ.get("BEDROCK_MODEL_ID", "anthropic.claude-3-haiku-20240307-v1:0")
+
+logger = logging.getLogger(__name__)
+
+# Limits on the findings section of the prompt. Keeps input tokens, cost and
+# latency bounded no matter how many findings are collected (~4k tokens).
+# Single lines are clipped too, since the size budget is checked before each
+# line is written and one oversized description could otherwise blow past it
+MAX_CATEGORIES = 20
+MAX_FINDINGS_PER_CATEGORY = 5
+MAX_PROMPT_CHARS = 16000
+MAX_LINE_CHARS = 300
+
+# Basic report returned when AI generation fails. This includes general
+# guidance that applies to most AWS environments
+_FALLBACK_NARRATIVE = (
+    "# AWS Access Review Report\n\n"
+    "## Executive Summary\n\n"
+    "Due to technical limitations, a detailed AI analysis could not be generated. "
+    "Please refer to the CSV report for a complete list of findings.\n\n"
+    "## Key Recommendations\n\n"
+    "1. **High Priority:** Review all findings marked as Critical or High priority first\n"
+    "2. **Medium Priority:** Address Medium priority findings as part of regular maintenance\n"
+    "3. **Low Priority:** Consider Low priority findings for long-term security improvements\n"
+    "4. **Ongoing:** Maintain regular security reviews and monitoring\n\n"
+    "## Next Steps\n\n"
+    "For detailed findings and specific recommendations, please consult the attached CSV"
+    " report. Consider scheduling a follow-up security review once the highest priority items"
+    " have been addressed.\n\n"
+    "---\n"
+    "This report was generated by the AWS Access Review Tool. For questions or assistance, "
+    "please contact your security team."
+)
+
+# Layout of the findings prompt built by prepare_prompt(). The summary already
+# starts with a line break before each of its lines
+_PROMPT_TEMPLATE = """<findings>
+# AWS Security Findings Summary
+
+Total findings: {total}
+- Critical: {critical}
+- High: {high}
+- Medium: {medium}
+- Low: {low}
+- Informational: {informational}
+
+## Findings by Category:{summary}
+</findings>
+"""
+
+# Appended to batched multi-account prompts so each report can be split back out
+BATCH_INSTRUCTIONS = (
+    "\nThe findings above cover several AWS accounts, each inside an <account> tag. "
+    "Write a separate, brief report for each account (at most about 600 words) and "
+    'wrap it in <report account="ACCOUNT_ID"></report> tags, using the id from the '
+    "matching <account> tag.\n"
+)
+
+# Output tokens budgeted for each account in a batched request. At most as many
+# accounts as fit in the 4096 token output ceiling share one request, so a long
+# response can't cut off the reports of the accounts that come last
+BATCH_TOKENS_PER_ACCOUNT = 1024
+BATCH_MAX_ACCOUNTS = 4096 // BATCH_TOKENS_PER_ACCOUNT
+_REPORT_PATTERN = re.compile(r'<report account="([^"]+)">(.*?)</report>', re.DOTALL)
+
+# Bedrock client settings. Adaptive retries back off client-side when Bedrock
+# throttles, and the larger pool lets concurrent calls share one client. The
+# attempts and timeouts are capped so that a stalled call fails over to the
+# fallback narrative well inside the 300s Lambda timeout: the worst case is
+# 3 attempts x (5s connect + 50s read) plus at most 2 x 20s backoff, ~205s.
+# The read timeout applies per socket read, so the report paths all use the
+# streaming API, where chunks keep arriving while a long report is generated
+BEDROCK_CLIENT_CONFIG = Config(
+    retries={"total_max_attempts": 3, "mode": "adaptive"},
+    max_pool_connections=32,
+    read_timeout=50,
+    connect_timeout=5,
+    tcp_keepalive=True,
+)
+
+# Finding sets this small get a lower temperature (see inference_config_for)
+SMALL_INPUT_FINDINGS = 5
+
+# Output token ceiling per request (see inference_config_for): a fixed budget for
+# the report structure plus an allowance per category and per finding listed in
+# the prompt, capped at the model's 4096 token default
+REPORT_BASE_TOKENS = 1024
+REPORT_TOKENS_PER_CATEGORY = 32
+REPORT_TOKENS_PER_FINDING = 64
+
+# Appended to a narrative that hit the output token ceiling
+_TRUNCATION_NOTICE = (
+    "\n\n*Note: This report was cut off because it reached the maximum response "
+    "length. Please refer to the CSV report for the complete list of findings.*"
+)
+
+# Shared Bedrock client, created on first use and reused across warm Lambda
+# invocations so connections stay open between calls
+_BEDROCK_CLIENT = None
+
+# Default models for race_claude(): Claude 3 Haiku with Claude 3 Sonnet as backup
+RACE_MODEL_IDS = (MODEL_ID, "anthropic.claude-3-sonnet-20240229-v1:0")
+
+# Severity order used to rank findings (Critical first)
+SEVERITY_ORDER = {
+    "Critical": 0,
+    "High": 1,
+    "Medium": 2,
+    "Low": 3,
+    "Informational": 4,
+}
+
+# Sort key for (severity rank, finding) pairs
+_RANK = itemgetter(0)
+
+# Marks a finding without a severity field, which is ranked as Low
+_MISSING = object()
+
+# Static instructions sent as the system prompt, separate from the per-report
+# findings in the user message. At roughly 100 tokens they are well below the
+# minimum cacheable prefix (1024 tokens, 2048 for Haiku models), so Bedrock
+# prompt caching is not used
+SYSTEM_INSTRUCTIONS = (
+    "You are a cybersecurity expert analyzing AWS security findings. "
+    "Generate a concise, professional security report based on the findings "
+    "provided by the user inside <findings> tags.\n\n"
+    "Your report should include:\n"
+    "1. An executive summary of the security posture\n"
+    "2. Analysis of the most critical findings\n"
+    "3. Clear, actionable recommendations\n"
+    "4. Compliance implications\n\n"
+    "Format the report with clear headings and concise language suitable for both "
+    "technical and non-technical stakeholders."
+)
+
+# Static Converse request fragments, shared by every request
+_SYSTEM_PROMPT = [{"text": SYSTEM_INSTRUCTIONS}]
+_INFERENCE_CONFIG = {"maxTokens": 4096, "temperature": 0.7, "topP": 0.9}
+_LATENCY_OPTIMIZED_CONFIG = {"latency": "optimized"}
 
 
 def get_ai_analysis(bedrock_client, findings):
@@ -37,7 +200,8 @@ def get_ai_analysis(bedrock_client, findings):
     4. Handles any errors gracefully with fallback content
 
     Args:
-        bedrock_client: Initialized Bedrock client with appropriate permissions
+        bedrock_client: Initialized Bedrock client with appropriate permissions,
+                        or None to use the shared client from _get_client()
         findings (list): List of security findings in standardized format
                         Each finding should be a dictionary with fields like
                         severity, category, description, resource_type, etc.
@@ -47,20 +211,59 @@ def get_ai_analysis(bedrock_client, findings):
              If AI generation fails, returns a basic fallback narrative
     """
     try:
+        # Skip the Bedrock round-trip when there is nothing for the AI to analyze
+        if _is_trivial(findings):
+            print("No significant findings - skipping AI analysis")
+            return _empty_narrative(len(findings))
+
         # Step 1: Prepare the prompt for Claude model
         # This formats our findings into a structure that helps the AI understand the data
         print("Preparing AI prompt from security findings...")
-        prompt = prepare_prompt(findings)
+        prompt, shown_counts = _build_prompt(findings)
+        inference_config = inference_config_for(len(findings), shown_counts)
 
         # Step 2: Call Bedrock with the Claude model
-        # This sends our formatted data to Amazon Bedrock and gets a response
-        print("Invoking Amazon Bedrock Claude model...")
-        response = invoke_claude_model(bedrock_client, prompt)
+        # The shared client is reused across warm Lambda invocations
+        if bedrock_client is None:
+            bedrock_client = _get_client()
+        model_ids = race_model_ids()
+        if model_ids and aioboto3 is None:
+            print(
+                "Warning: BEDROCK_RACE_MODEL_IDS is set but aioboto3 is not "
+                "installed - calling a single model instead"
+            )
+            model_ids = ()
+        elif model_ids and _in_event_loop():
+            # asyncio.run() can't be nested; async callers should use
+            # agenerate_narrative() instead
+            print(
+                "Warning: get_ai_analysis() called from a running event loop - "
+                "calling a single model instead of racing"
+            )
+            model_ids = ()
+
+        if model_ids:
+            # Opt-in: call several models at once and keep the first answer
+            print(f"Racing Amazon Bedrock models: {', '.join(model_ids)}")
+            response = asyncio.run(
+                race_claude(
+                    prompt,
+                    model_ids,
+                    inference_config,
+                    region_name=bedrock_client.meta.region_name,
+                )
+            )
+        else:
+            # The response is streamed so text arrives as soon as it is generated
+            print("Invoking Amazon Bedrock Claude model...")
+            response = invoke_claude_model_stream(
+                bedrock_client, prompt, inference_config
+            )
 
-        # Step 3: Extract and return the generated narrative
-        # This processes the raw API response and extracts the useful content
+        # Step 3: Collect the streamed narrative
+        # This reads the text chunks from the response stream as they arrive
         print("Processing AI response...")
-        narrative = extract_narrative_claude(response)
+        narrative = "".join(stream_narrative_claude(response)).strip()
         print("AI narrative generation successful")
         return narrative
 
@@ -79,6 +282,22 @@ def get_ai_analysis(bedrock_client, findings):
         return generate_fallback_narrative()
 
 
+def _get_client():
+    """
+    Return the shared Bedrock runtime client, creating it on first use.
+
+    Creating a client loads service models and builds a new connection pool, so
+    reusing one client avoids that cost and keeps TCP/TLS connections alive.
+
+    Returns:
+        Boto3 bedrock-runtime client
+    """
+    global _BEDROCK_CLIENT
+    if _BEDROCK_CLIENT is None:
+        _BEDROCK_CLIENT = boto3.client("bedrock-runtime", config=BEDROCK_CLIENT_CONFIG)
+    return _BEDROCK_CLIENT
+
+
 def generate_narrative(findings):
     """
     Generate a narrative summary of security findings using Amazon Bedrock's Claude model.
@@ -102,14 +321,221 @@ def generate_narrative(findings):
         # Include narrative in email or report
         send_email(recipient, subject, narrative, attachment)
     """
-    # Initialize Bedrock client
-    # The client is created here so callers don't need to worry about it
-    bedrock = boto3.client("bedrock-runtime")
+    # Get the shared Bedrock client
+    # The client is managed here so callers don't need to worry about it
+    bedrock = _get_client()
 
     # Call the main function with the initialized client
     return get_ai_analysis(bedrock, findings)
 
 
+def generate_narratives_batched(findings_by_account):
+    """
+    Generate one narrative per AWS account, batching several accounts per Bedrock call.
+
+    In multi-account reviews this avoids paying a separate Bedrock round-trip for
+    every account. The findings for each account are wrapped in
+    <account id="..."> tags and the model is asked to answer with one
+    <report account="..."> block per account, which is split back out here.
+    Each call covers at most BATCH_MAX_ACCOUNTS accounts so that all of their
+    reports fit in the response.
+
+    Args:
+        findings_by_account (dict): Mapping of account ID to that account's
+                                    list of security findings
+
+    Returns:
+        dict: Mapping of account ID to its narrative. Accounts missing from the
+              model response are requested separately; if a batched call fails,
+              its accounts get the fallback narrative
+    """
+    if not findings_by_account:
+        return {}
+
+    # A single account doesn't need the batching wrapper
+    if len(findings_by_account) == 1:
+        account_id, findings = next(iter(findings_by_account.items()))
+        return {account_id: generate_narrative(findings)}
+
+    # Accounts with nothing for the AI to analyze are left out of the batch
+    narratives = {
+        account_id: _empty_narrative(len(findings or ()))
+        for account_id, findings in findings_by_account.items()
+        if _is_trivial(findings)
+    }
+    batch = {
+        account_id: findings
+        for account_id, findings in findings_by_account.items()
+        if account_id not in narratives
+    }
+    if not batch:
+        return narratives
+
+    # Group the accounts so that every report in a group fits in one response.
+    # The groups are independent Bedrock calls, so they run in parallel
+    account_ids = list(batch)
+    groups = [
+        {
+            account_id: batch[account_id]
+            for account_id in account_ids[i : i + BATCH_MAX_ACCOUNTS]
+        }
+        for i in range(0, len(account_ids), BATCH_MAX_ACCOUNTS)
+    ]
+    print(
+        f"Preparing batched AI prompts for {len(batch)} accounts in {len(groups)} requests..."
+    )
+    bedrock = _get_client()
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=min(8, len(groups))
+    ) as executor:
+        for reports in executor.map(
+            lambda group: _generate_batch(bedrock, group), groups
+        ):
+            narratives.update(reports)
+
+    # Return the narratives in the same account order as the input
+    return {account_id: narratives[account_id] for account_id in findings_by_account}
+
+
+def _generate_batch(bedrock, batch):
+    """
+    Generate the narratives for one group of accounts with a single Bedrock call.
+
+    Accounts missing from an otherwise successful response (e.g. because the
+    model ran out of output tokens) are retried with a separate call each.
+
+    Args:
+        bedrock: Boto3 bedrock-runtime client
+        batch (dict): Mapping of account ID to findings, at most BATCH_MAX_ACCOUNTS
+
+    Returns:
+        dict: Mapping of account ID to its narrative. If the batched call fails,
+              every account gets the fallback narrative
+    """
+    try:
+        account_blocks = [
+            f'<account id="{account_id}">\n{prepare_prompt(findings)}</account>'
+            for account_id, findings in batch.items()
+        ]
+        prompt = "\n".join(account_blocks) + BATCH_INSTRUCTIONS
+        inference_config = {
+            **_INFERENCE_CONFIG,
+            "maxTokens": BATCH_TOKENS_PER_ACCOUNT * len(batch),
+        }
+
+        print(f"Invoking Amazon Bedrock Claude model for {len(batch)} accounts...")
+        response = invoke_claude_model_stream(bedrock, prompt, inference_config)
+
+        print("Processing AI response...")
+        text = "".join(stream_narrative_claude(response))
+
+    except Exception as e:
+        print(f"Error generating batched narratives with Bedrock: {str(e)}")
+        import traceback
+
+        print(f"Error stack trace: {traceback.format_exc()}")
+        print(f"Using fallback narrative for accounts {', '.join(batch)}")
+        return dict.fromkeys(batch, generate_fallback_narrative())
+
+    narratives = {
+        account_id: report.strip()
+        for account_id, report in _REPORT_PATTERN.findall(text)
+        if account_id in batch
+    }
+    print(f"Received narratives for {len(narratives)} of {len(batch)} accounts")
+
+    for account_id, findings in batch.items():
+        if account_id not in narratives:
+            print(
+                f"No report for account {account_id} in batched response, requesting it separately"
+            )
+            narratives[account_id] = get_ai_analysis(bedrock, findings)
+
+    return narratives
+
+
+def generate_narratives_parallel(findings_list, max_workers=8):
+    """
+    Generate narratives for several independent sets of findings in parallel.
+
+    Each set gets its own Bedrock call, run in a thread pool. The calls spend their
+    time waiting on the network (which releases the GIL), so up to max_workers
+    of them run at once. All threads share the module-level client and its
+    connection pool, which is sized for more connections than the default
+    number of workers.
+
+    Args:
+        findings_list (list): List of findings lists, e.g. one per account
+        max_workers (int): Maximum number of concurrent Bedrock calls
+
+    Returns:
+        list: Narratives in the same order as findings_list
+    """
+    # Create the shared client up front rather than racing to create it in the threads
+    bedrock = _get_client()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(
+            executor.map(
+                lambda findings: get_ai_analysis(bedrock, findings), findings_list
+            )
+        )
+
+
+async def agenerate_narrative(findings):
+    """
+    Async version of generate_narrative() for callers running in an event loop.
+
+    A single aioboto3 session is created per request and used for the Bedrock call,
+    so several reports can be generated concurrently (e.g. with asyncio.gather).
+    If aioboto3 is not installed, the synchronous path runs in the default executor.
+
+    Args:
+        findings (list): List of security findings from various AWS services
+
+    Returns:
+        str: AI-generated narrative summary, or the fallback narrative on error
+    """
+    try:
+        # Skip the Bedrock round-trip when there is nothing for the AI to analyze
+        if _is_trivial(findings):
+            print("No significant findings - skipping AI analysis")
+            return _empty_narrative(len(findings))
+
+        if aioboto3 is None:
+            # No native async client available - keep the event loop free by
+            # running the blocking boto3 call in a worker thread
+            print("aioboto3 not installed, running Bedrock call in executor")
+            bedrock = _get_client()
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, get_ai_analysis, bedrock, findings)
+
+        session = aioboto3.Session()
+
+        print("Preparing AI prompt from security findings...")
+        prompt, shown_counts = _build_prompt(findings)
+
+        print("Invoking Amazon Bedrock Claude model (async)...")
+        response = await ainvoke_claude_model(
+            session,
+            prompt,
+            inference_config=inference_config_for(len(findings), shown_counts),
+        )
+
+        print("Processing AI response...")
+        narrative = "".join(stream_narrative_claude(response)).strip()
+        print("AI narrative generation successful")
+        return narrative
+
+    except Exception as e:
+        print(f"Error generating narrative with Bedrock: {str(e)}")
+        import traceback
+
+        print(f"Error stack trace: {traceback.format_exc()}")
+        print("Using fallback narrative due to error")
+        return generate_fallback_narrative()
+
+
 def prepare_prompt(findings):
     """
     Prepare a prompt for the Claude model based on the security findings.
@@ -129,7 +555,21 @@ def prepare_prompt(findings):
     Returns:
         str: Formatted prompt for the Claude model, optimized for security analysis
     """
-    # Step 1: Count findings by severity for statistical summary
+    return _build_prompt(findings)[0]
+
+
+def _build_prompt(findings):
+    """
+    Build the findings prompt and record how much of it was shown to the model.
+
+    Args:
+        findings (list): List of security findings from various AWS services
+
+    Returns:
+        tuple: (prompt, shown_counts), where shown_counts lists the number of
+               findings written for each category included in the prompt
+    """
+    # Step 1: Count findings by severity and group them by category in one pass
     # Initialize counters for each severity level
     severity_counts = {
         "Critical": 0,  # Immediate action required
@@ -139,164 +579,438 @@ def prepare_prompt(findings):
         "Informational": 0,  # Awareness only
     }
 
-    # Count findings for each severity level
-    for finding in findings:
-        if finding.get("severity") in severity_counts:
-            severity_counts[finding.get("severity")] += 1
-
-    # Step 2: Group findings by category for better organization
+    # Each category maps to a list of (severity rank, finding) pairs
     # e.g., IAM findings, S3 findings, etc.
-    findings_by_category = {}
+    findings_by_category = defaultdict(list)
     for finding in findings:
+        # Findings without a severity are ranked as Low (but not counted as
+        # Low), unknown severities last
+        severity = finding.get("severity", _MISSING)
+        if severity is _MISSING:
+            rank = 3
+        else:
+            rank = SEVERITY_ORDER.get(severity, 999)
+            if rank != 999:
+                severity_counts[severity] += 1
+
         # Use "Other" as default category if not specified
         category = finding.get("category", "Other")
+        findings_by_category[category].append((rank, finding))
 
-        # Initialize category list if this is first finding of this type
-        if category not in findings_by_category:
-            findings_by_category[category] = []
-
-        # Add this finding to its category group
-        findings_by_category[category].append(finding)
+    # Rank of the most severe finding in each category
+    category_ranks = {
+        category: min(map(_RANK, ranked_findings))
+        for category, ranked_findings in findings_by_category.items()
+    }
 
-    # Step 3: Create a formatted summary of findings for the prompt
-    # We'll organize them by category, with the most severe findings first
-    findings_summary = []
+    # Step 2: Create a formatted summary of findings for the prompt
+    # We'll organize them by category, most severe categories and findings first.
+    # The number of categories and the total size are capped so that large or
+    # unusual inputs can't grow the prompt (and its cost and latency) unbounded
+    # Every line is written to one growing buffer, prefixed with its line break,
+    # and the buffer position doubles as the running size of the summary
+    categories = sorted(findings_by_category, key=category_ranks.get)
+    summary = io.StringIO()
+    omitted = 0
+    shown_counts = []
+
+    # Findings in categories beyond the cap are only counted
+    for category in categories[MAX_CATEGORIES:]:
+        omitted += len(findings_by_category[category])
 
     # Process each category of findings
-    for category, category_findings in findings_by_category.items():
-        # Add category header
-        findings_summary.append(f"\nCategory: {category}")
-
-        # Define severity order for sorting (Critical first)
-        severity_order = {
-            "Critical": 0,
-            "High": 1,
-            "Medium": 2,
-            "Low": 3,
-            "Informational": 4,
-        }
+    for category in categories[:MAX_CATEGORIES]:
+        ranked_findings = findings_by_category[category]
 
-        # Sort findings within this category by severity
-        sorted_findings = sorted(
-            category_findings,
-            key=lambda x: severity_order.get(x.get("severity", "Low"), 999),
-        )
+        # Once the size budget is used up, remaining findings are only counted
+        if summary.tell() > MAX_PROMPT_CHARS:
+            omitted += len(ranked_findings)
+            continue
+
+        # Add category header
+        label = _clip(str(category))
+        summary.write(f"\n\nCategory: {label}")
 
         # Add the 5 most important findings for this category
-        # Limiting to 5 per category keeps the prompt manageable in size
-        for finding in sorted_findings[:5]:
-            summary = (
+        # Limiting to 5 per category keeps the prompt manageable in size, and
+        # nsmallest avoids sorting the whole category to get them
+        shown = 0
+        for _, finding in heapq.nsmallest(
+            MAX_FINDINGS_PER_CATEGORY, ranked_findings, key=_RANK
+        ):
+            if summary.tell() > MAX_PROMPT_CHARS:
+                break
+            line = (
                 f"  - {finding.get('severity')}: {finding.get('description')} "
                 f"({finding.get('resource_type')}: {finding.get('resource_id')})"
             )
-            findings_summary.append(summary)
-
-        # If there are more findings than we showed, add a count of remaining ones
-        if len(category_findings) > 5:
-            findings_summary.append(
-                f"  - ... and {len(category_findings) - 5} more {category} findings"
-            )
-
-    # Step 4: Construct the complete prompt for Claude
+            summary.write("\n")
+            summary.write(_clip(line))
+            shown += 1
+        shown_counts.append(shown)
+
+        remaining = len(ranked_findings) - shown
+        if shown < min(MAX_FINDINGS_PER_CATEGORY, len(ranked_findings)):
+            # Cut short by the size budget
+            omitted += remaining
+        elif remaining > 0:
+            # If there are more findings than we showed, add a count of remaining ones
+            summary.write(f"\n  - ... and {remaining} more {label} findings")
+
+    if omitted:
+        summary.write(f"\n\n... and {omitted} additional findings omitted")
+
+    # Step 3: Construct the complete prompt for Claude
     # We use XML tags to help Claude identify the findings section clearly
     # Format is designed to be clear and structured for optimal AI processing
-    prompt = f"""<findings>
-# AWS Security Findings Summary
+    prompt = _PROMPT_TEMPLATE.format(
+        total=len(findings),
+        critical=severity_counts["Critical"],
+        high=severity_counts["High"],
+        medium=severity_counts["Medium"],
+        low=severity_counts["Low"],
+        informational=severity_counts["Informational"],
+        summary=summary.getvalue() or "\n",
+    )
 
-Total findings: {len(findings)}
-- Critical: {severity_counts['Critical']}
-- High: {severity_counts['High']}
-- Medium: {severity_counts['Medium']}
-- Low: {severity_counts['Low']}
-- Informational: {severity_counts['Informational']}
+    return prompt, shown_counts
 
-## Findings by Category:
-{chr(10).join(findings_summary)}
-</findings>
-"""
 
-    return prompt
+def _clip(text, limit=MAX_LINE_CHARS):
+    """
+    Shorten a single prompt line to at most limit characters.
+
+    Args:
+        text (str): Line to shorten
+        limit (int): Maximum length of the returned line
+
+    Returns:
+        str: The line, cut off with "..." if it was longer than limit
+    """
+    if len(text) <= limit:
+        return text
+    return text[: limit - 3] + "..."
+
+
+def latency_optimized_enabled():
+    """
+    Check whether Bedrock latency-optimized inference should be requested.
+
+    Latency-optimized inference is only offered for some models and regions, and
+    must be called through an inference profile, so it is opt-in via the
+    BEDROCK_LATENCY_OPTIMIZED=1 environment variable. The default Claude 3 Haiku
+    model does not support it; set BEDROCK_MODEL_ID to a supported model too.
+
+    Returns:
+        bool: True if the performanceConfig latency flag should be sent
+    """
+    return os.environ.get("BEDROCK_LATENCY_OPTIMIZED", "0") == "1"
 
 
-def invoke_claude_model(bedrock, prompt):
+def race_model_ids():
     """
-    Invoke the Claude 3 model via Amazon Bedrock using the Messages API.
+    Get the models get_ai_analysis() should race, if racing is enabled.
+
+    Racing is opt-in via the BEDROCK_RACE_MODEL_IDS environment variable, a
+    comma-separated list of Bedrock model IDs, e.g.
+    "anthropic.claude-3-haiku-20240307-v1:0,anthropic.claude-3-sonnet-20240229-v1:0".
+
+    Returns:
+        tuple: Model IDs to race, or an empty tuple if racing is disabled
+    """
+    value = os.environ.get("BEDROCK_RACE_MODEL_IDS", "")
+    return tuple(model_id.strip() for model_id in value.split(",") if model_id.strip())
+
+
+def inference_config_for(findings_count, shown_counts):
+    """
+    Size the inference settings to the findings being analyzed.
+
+    Small finding sets need far shorter reports, and a lower output ceiling lets
+    Bedrock finish (and schedule) them faster. The ceiling follows what the
+    prompt actually shows the model, as recorded while building it, rather
+    than the raw number of findings. Very small inputs also get a lower
+    temperature for more focused, typically shorter, output.
+
+    Args:
+        findings_count (int): Total number of findings the prompt was built from
+        shown_counts (list): Findings listed per category in the prompt, as
+                             returned by _build_prompt()
+
+    Returns:
+        dict: Converse inferenceConfig for the request
+    """
+    max_tokens = (
+        REPORT_BASE_TOKENS
+        + REPORT_TOKENS_PER_CATEGORY * len(shown_counts)
+        + REPORT_TOKENS_PER_FINDING * sum(shown_counts)
+    )
+    inference_config = {
+        **_INFERENCE_CONFIG,
+        "maxTokens": min(_INFERENCE_CONFIG["maxTokens"], max_tokens),
+    }
+    if findings_count <= SMALL_INPUT_FINDINGS:
+        inference_config["temperature"] = 0.3
+    return inference_config
+
+
+def build_converse_request(prompt, model_id=MODEL_ID, inference_config=None):
+    """
+    Build the Converse API request parameters for the Claude 3 model.
+
+    Shared by the synchronous and async invocation paths so both send
+    exactly the same request to Bedrock.
 
     Args:
-        bedrock: Boto3 Bedrock client
         prompt (str): The formatted security findings to analyze
+        model_id (str): Bedrock model ID to invoke (defaults to Claude 3 Haiku)
+        inference_config (dict): Optional Converse inferenceConfig, e.g. from
+                                 inference_config_for(); defaults to 4096 max tokens
 
     Returns:
-        dict: The raw model response as a Python dictionary
-    """
-    model_id = "anthropic.claude-3-haiku-20240307-v1:0"
-
-    request_body = {
-        "anthropic_version": "bedrock-2023-05-31",  # ✅ Required for Claude 3
-        "messages": [
-            {
-                "role": "user",
-                "content": (
-                    "You are a cybersecurity expert analyzing AWS security findings. "
-                    "Generate a concise, professional security report based on the following findings:\n\n"
-                    f"{prompt}\n\n"
-                    "Your report should include:\n"
-                    "1. An executive summary of the security posture\n"
-                    "2. Analysis of the most critical findings\n"
-                    "3. Clear, actionable recommendations\n"
-                    "4. Compliance implications\n\n"
-                    "Format the report with clear headings and concise language suitable for both "
-                    "technical and non-technical stakeholders."
-                )
-            }
-        ],
-        "max_tokens": 4096,
-        "temperature": 0.7,
-        "top_p": 0.9,
+        dict: Keyword arguments for bedrock-runtime converse()
+    """
+    # Only the user message changes between calls; the static parts of the
+    # request are built once at import time
+    request = {
+        "modelId": model_id,
+        "system": _SYSTEM_PROMPT,
+        "messages": [{"role": "user", "content": [{"text": prompt}]}],
+        "inferenceConfig": inference_config or _INFERENCE_CONFIG,
     }
 
-    print(f"Calling Bedrock API with model: {model_id} (using Messages API)")
-    print("Sending request body to Bedrock (truncated preview):")
-    print(json.dumps(request_body, indent=2)[:1500])  # Print first 1500 chars for readability
+    # performanceConfig is only accepted by the Converse API
+    if latency_optimized_enabled():
+        request["performanceConfig"] = _LATENCY_OPTIMIZED_CONFIG
 
-    try:
-        response = bedrock.invoke_model(
-            modelId=model_id,
-            contentType="application/json",
-            accept="application/json",
-            body=json.dumps(request_body),
+    return request
+
+
+def _log_request_preview(request):
+    """
+    Log a truncated preview of the user prompt when debug logging is enabled.
+
+    Only the first 500 characters are serialized, so nothing is built for the
+    (potentially large) findings prompt unless debug output was asked for.
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        preview = request["messages"][0]["content"][0]["text"][:500]
+        logger.debug(
+            "Bedrock request preview: %s", json.dumps(preview, separators=(",", ":"))
         )
 
-        # Read and parse response
-        raw_response_body = response.get("body").read()
-        response_body = json.loads(raw_response_body)
+
+def _log_response_preview(response):
+    """
+    Log a truncated preview of the generated text when debug logging is enabled.
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        content = response.get("output", {}).get("message", {}).get("content", [{}])
+        preview = content[0].get("text", "")[:500] if content else ""
+        logger.debug(
+            "Bedrock response preview: %s", json.dumps(preview, separators=(",", ":"))
+        )
+
+
+def invoke_claude_model(bedrock, prompt, inference_config=None):
+    """
+    Invoke the Claude 3 model via Amazon Bedrock using the Converse API.
+
+    Bedrock sends nothing until generation has finished, so long reports need a
+    client whose read timeout covers the whole generation. The report paths in
+    this module use invoke_claude_model_stream() instead.
+
+    Args:
+        bedrock: Boto3 Bedrock client
+        prompt (str): The formatted security findings to analyze
+        inference_config (dict): Optional Converse inferenceConfig, e.g. from
+                                 inference_config_for(); defaults to 4096 max tokens
+
+    Returns:
+        dict: The raw Converse API response
+    """
+    request = build_converse_request(prompt, inference_config=inference_config)
+
+    print(f"Calling Bedrock API with model: {request['modelId']} (using Converse API)")
+    _log_request_preview(request)
+
+    try:
+        response = bedrock.converse(**request)
 
         print("Successfully received response from Bedrock (Claude 3)")
-        print("Response content (truncated preview):")
-        print(json.dumps(response_body, indent=2)[:1500])  # Again, truncate to avoid log bloat
+        _log_response_preview(response)
 
-        return response_body
+        return response
 
     except Exception as e:
         print(f"Exception while calling Bedrock: {e}")
         import traceback
+
         print(traceback.format_exc())
         raise  # Let the caller handle fallback logic
 
 
+def invoke_claude_model_stream(bedrock, prompt, inference_config=None):
+    """
+    Invoke the Claude 3 model via Amazon Bedrock with a streamed response.
+
+    Unlike invoke_claude_model(), this returns as soon as Bedrock starts sending
+    the response, so callers can process text before generation has finished.
+
+    Args:
+        bedrock: Boto3 Bedrock client
+        prompt (str): The formatted security findings to analyze
+        inference_config (dict): Optional Converse inferenceConfig, e.g. from
+                                 inference_config_for(); defaults to 4096 max tokens
+
+    Returns:
+        dict: The raw ConverseStream API response; read it with stream_narrative_claude()
+    """
+    request = build_converse_request(prompt, inference_config=inference_config)
+
+    print(
+        f"Calling Bedrock API with model: {request['modelId']} (using ConverseStream API)"
+    )
+    _log_request_preview(request)
+
+    try:
+        response = bedrock.converse_stream(**request)
+        print("Bedrock response stream opened (Claude 3)")
+        return response
+
+    except Exception as e:
+        print(f"Exception while calling Bedrock: {e}")
+        import traceback
+
+        print(traceback.format_exc())
+        raise  # Let the caller handle fallback logic
+
+
+async def ainvoke_claude_model(
+    session, prompt, model_id=MODEL_ID, inference_config=None
+):
+    """
+    Invoke the Claude 3 model via Amazon Bedrock without blocking the event loop.
+
+    The ConverseStream API is used so that BEDROCK_CLIENT_CONFIG's read timeout
+    applies to each chunk rather than to the whole generation, which can take
+    longer than that for long reports or slower models. The stream is read to
+    the end before the client is closed.
+
+    Args:
+        session: aioboto3.Session used to create the async Bedrock client
+        prompt (str): The formatted security findings to analyze
+        model_id (str): Bedrock model ID to invoke (defaults to Claude 3 Haiku)
+        inference_config (dict): Optional Converse inferenceConfig, e.g. from
+                                 inference_config_for(); defaults to 4096 max tokens
+
+    Returns:
+        dict: The ConverseStream API response with its stream already read into a
+              list of events; read it with stream_narrative_claude()
+    """
+    request = build_converse_request(prompt, model_id, inference_config)
+
+    print(
+        f"Calling Bedrock API with model: {request['modelId']} "
+        "(async, using ConverseStream API)"
+    )
+
+    try:
+        async with session.client(
+            "bedrock-runtime", config=BEDROCK_CLIENT_CONFIG
+        ) as bedrock:
+            response = await bedrock.converse_stream(**request)
+            events = [event async for event in response["stream"]]
+
+        print("Successfully received response from Bedrock (Claude 3, async)")
+        return {**response, "stream": events}
+
+    except Exception as e:
+        print(f"Exception while calling Bedrock: {e}")
+        import traceback
+
+        print(traceback.format_exc())
+        raise  # Let the caller handle fallback logic
+
+
+async def race_claude(
+    prompt, model_ids=RACE_MODEL_IDS, inference_config=None, region_name=None
+):
+    """
+    Invoke several Claude models concurrently and return the first successful response.
+
+    All models are called at once, so if the primary model is slow or failing the
+    report costs roughly max(t_primary, t_secondary) instead of their sum. Calls
+    still running when a response arrives are cancelled.
+
+    Args:
+        prompt (str): The formatted security findings to analyze
+        model_ids (tuple): Bedrock model IDs to race against each other
+        inference_config (dict): Optional Converse inferenceConfig, e.g. from
+                                 inference_config_for(); defaults to 4096 max tokens
+        region_name (str): Region of the Bedrock clients, e.g. the region of the
+                           synchronous client; defaults to the session's region
+
+    Returns:
+        dict: The response from the first model to succeed, as returned by
+              ainvoke_claude_model()
+
+    Raises:
+        ValueError: If no model IDs are given
+        RuntimeError: If aioboto3 is not installed
+        Exception: The last model error if every model failed
+    """
+    if not model_ids:
+        raise ValueError("At least one Bedrock model ID is required to race")
+    if aioboto3 is None:
+        raise RuntimeError("aioboto3 is required to race Bedrock models")
+
+    session = aioboto3.Session(region_name=region_name)
+    tasks = {
+        asyncio.create_task(
+            ainvoke_claude_model(session, prompt, model_id, inference_config)
+        ): model_id
+        for model_id in model_ids
+    }
+    pending = set(tasks)
+    last_error = None
+
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None:
+                    print(f"Using response from {tasks[task]} (first to complete)")
+                    return task.result()
+                last_error = task.exception()
+                print(f"Model {tasks[task]} failed: {last_error}")
+    finally:
+        # Stop the slower calls once we have an answer
+        for task in pending:
+            task.cancel()
+
+    raise last_error
+
+
 def extract_narrative_claude(response):
     """
     Extract the generated narrative from the Claude 3 response.
     """
     try:
-        # Claude 3 (Messages API) returns content as a list of parts
-        content_parts = response.get("content", [])
-        
-        # Concatenate all text parts
+        # The Converse API returns the assistant message as a list of content blocks
+        content_parts = response["output"]["message"]["content"]
+
+        # Concatenate all text blocks
         narrative = ""
         for part in content_parts:
-            if part.get("type") == "text":
-                narrative += part.get("text", "")
+            narrative += part.get("text", "")
+
+        # A report that ran into the token ceiling is kept, but marked as cut off
+        if response.get("stopReason") == "max_tokens":
+            print("Warning: Bedrock response was truncated at the max token limit")
+            return narrative.strip() + _TRUNCATION_NOTICE
 
         return narrative.strip()
 
@@ -304,40 +1018,107 @@ def extract_narrative_claude(response):
         print(f"Error extracting narrative from Bedrock response: {str(e)}")
         print(f"Problematic response: {response}")
         import traceback
+
         print(f"Error stack trace: {traceback.format_exc()}")
         return generate_fallback_narrative()
 
 
-def generate_fallback_narrative():
+def stream_narrative_claude(response):
     """
-    Generate a basic narrative if the AI model fails.
+    Yield the generated narrative text from a Claude 3 ConverseStream response.
+
+    Args:
+        response (dict): Response returned by invoke_claude_model_stream()
+
+    Yields:
+        str: Partial narrative text in the order it was generated, followed by a
+             note if the model stopped at the max token limit
+    """
+    # The stream contains message/content block start and stop events as well as
+    # metadata; only content block deltas carry generated text, and messageStop
+    # says why generation ended
+    for event in response["stream"]:
+        delta = event.get("contentBlockDelta")
+        if delta:
+            yield delta["delta"].get("text", "")
+        elif event.get("messageStop", {}).get("stopReason") == "max_tokens":
+            print(
+                "Warning: Bedrock response stream was truncated at the max token limit"
+            )
+            yield _TRUNCATION_NOTICE
 
-    This function provides a safety net when AI generation fails,
-    ensuring that users still receive a useful report even if
-    Bedrock is unavailable or returns an error.
+
+def _in_event_loop():
+    """
+    Check whether the caller is running inside an asyncio event loop.
 
     Returns:
-        str: A basic narrative summary with general security guidance
+        bool: True if asyncio.run() can't be used from the current thread
     """
-    print("Generating fallback narrative due to AI processing failure")
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def _is_trivial(findings):
+    """
+    Check whether the findings are too few or too minor to be worth an AI analysis.
+
+    Returns:
+        bool: True for no findings, or at most two findings that are all
+              Informational (or have no severity)
+    """
+    return not findings or (
+        len(findings) <= 2
+        and all(f.get("severity") in (None, "Informational") for f in findings)
+    )
+
+
+def _empty_narrative(findings_count):
+    """
+    Build the short report used when there are no significant findings.
+
+    Args:
+        findings_count (int): Number of (informational) findings collected
+
+    Returns:
+        str: Brief narrative stating that no significant findings were identified
+    """
+    if findings_count:
+        summary = (
+            "No significant security findings were identified in this review. "
+            f"Total findings: {findings_count} (informational only). "
+        )
+    else:
+        summary = "No security findings were identified in this review. "
 
-    # Return a professionally formatted basic report
-    # This includes general guidance that applies to most AWS environments
     return (
         "# AWS Access Review Report\n\n"
         "## Executive Summary\n\n"
-        "Due to technical limitations, a detailed AI analysis could not be generated. "
-        "Please refer to the CSV report for a complete list of findings.\n\n"
-        "## Key Recommendations\n\n"
-        "1. **High Priority:** Review all findings marked as Critical or High priority first\n"
-        "2. **Medium Priority:** Address Medium priority findings as part of regular maintenance\n"
-        "3. **Low Priority:** Consider Low priority findings for long-term security improvements\n"
-        "4. **Ongoing:** Maintain regular security reviews and monitoring\n\n"
+        f"{summary}"
+        "No remediation is required at this time.\n\n"
         "## Next Steps\n\n"
-        "For detailed findings and specific recommendations, please consult the attached CSV"
-        " report. Consider scheduling a follow-up security review once the highest priority items"
-        " have been addressed.\n\n"
+        "Continue regular access reviews and monitoring. "
+        "Please consult the attached CSV report for the full list of checks.\n\n"
         "---\n"
         "This report was generated by the AWS Access Review Tool. For questions or assistance, "
         "please contact your security team."
     )
+
+
+def generate_fallback_narrative():
+    """
+    Generate a basic narrative if the AI model fails.
+
+    This function provides a safety net when AI generation fails,
+    ensuring that users still receive a useful report even if
+    Bedrock is unavailable or returns an error.
+
+    Returns:
+        str: A basic narrative summary with general security guidance
+    """
+    print("Generating fallback narrative due to AI processing failure")
+
+    return _FALLBACK_NARRATIVE
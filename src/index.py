@@ -120,7 +120,9 @@ def handler(event, context):
 
     # These services should always be available in all accounts
     cloudtrail = boto3.client("cloudtrail")  # For audit trail analysis
-    bedrock = boto3.client("bedrock-runtime")  # For AI narrative generation
+    # The Bedrock client for AI narrative generation is created once by
+    # bedrock_integration and reused across warm invocations
+    bedrock = None
     s3 = boto3.client("s3")  # For storing report files
     ses = boto3.client("ses")  # For sending email reports
 
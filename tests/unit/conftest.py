@@ -0,0 +1,11 @@
+"""
+Shared pytest configuration for the unit tests.
+
+The Lambda code under src/ imports its modules as top-level packages
+(e.g. "import bedrock_integration"), so src/ is put on the import path here.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "src"))
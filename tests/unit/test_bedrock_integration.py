@@ -0,0 +1,361 @@
+"""
+Unit tests for the AI narrative generation in bedrock_integration.
+"""
+
+import asyncio
+import random
+import re
+import types
+
+import pytest
+
+import bedrock_integration
+
+
+class FakeBedrockClient:
+    """Stand-in for a bedrock-runtime client that streams canned responses."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+        self.meta = types.SimpleNamespace(region_name="us-east-1")
+
+    def converse_stream(self, **request):
+        self.requests.append(request)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        # Split the text across two deltas like a real stream would
+        middle = len(response) // 2
+        return {
+            "stream": [
+                {"contentBlockDelta": {"delta": {"text": response[:middle]}}},
+                {"contentBlockDelta": {"delta": {"text": response[middle:]}}},
+                {"messageStop": {"stopReason": "end_turn"}},
+            ]
+        }
+
+
+class FakeAioSession:
+    """Stand-in for aioboto3.Session whose models answer after a delay."""
+
+    def __init__(self, models):
+        # Maps model ID to (delay in seconds, response text or exception)
+        self.models = models
+        self.cancelled = []
+
+    def client(self, service_name, **kwargs):
+        return FakeAioClient(self)
+
+
+class FakeAioClient:
+    def __init__(self, session):
+        self.session = session
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def converse_stream(self, modelId, **request):
+        delay, result = self.session.models[modelId]
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.session.cancelled.append(modelId)
+            raise
+        if isinstance(result, Exception):
+            raise result
+        return {"stream": FakeAioStream(result)}
+
+
+class FakeAioStream:
+    def __init__(self, text):
+        self.events = [
+            {"contentBlockDelta": {"delta": {"text": text}}},
+            {"messageStop": {"stopReason": "end_turn"}},
+        ]
+
+    async def __aiter__(self):
+        for event in self.events:
+            yield event
+
+
+@pytest.fixture
+def use_aioboto3(monkeypatch):
+    """Replace aioboto3 with a module whose Session is a FakeAioSession."""
+
+    def install(models):
+        session = FakeAioSession(models)
+        fake_module = types.SimpleNamespace(Session=lambda **kwargs: session)
+        monkeypatch.setattr(bedrock_integration, "aioboto3", fake_module)
+        return session
+
+    return install
+
+
+@pytest.fixture
+def use_client(monkeypatch):
+    """Install a fake client as the shared Bedrock client."""
+
+    def install(client):
+        monkeypatch.setattr(bedrock_integration, "_BEDROCK_CLIENT", client)
+        return client
+
+    return install
+
+
+def findings(count=6, severity="High"):
+    return [
+        {
+            "severity": severity,
+            "category": "IAM",
+            "description": f"Finding {i}",
+            "resource_type": "AWS::IAM::User",
+            "resource_id": f"user-{i}",
+        }
+        for i in range(count)
+    ]
+
+
+def test_batched_reports_are_split_per_account(use_client):
+    client = use_client(
+        FakeBedrockClient(
+            '<report account="222">Report two</report>\n'
+            '<report account="111">\nReport one\n</report>'
+        )
+    )
+
+    narratives = bedrock_integration.generate_narratives_batched(
+        {"111": findings(), "222": findings(), "333": []}
+    )
+
+    assert list(narratives) == ["111", "222", "333"]
+    assert narratives["111"] == "Report one"
+    assert narratives["222"] == "Report two"
+    assert narratives["333"] == bedrock_integration._empty_narrative(0)
+    assert len(client.requests) == 1
+    assert client.requests[0]["inferenceConfig"]["maxTokens"] == 2048
+
+
+def test_missing_account_is_requested_separately(use_client):
+    client = use_client(
+        FakeBedrockClient(
+            '<report account="111">Report one</report>\n<report account="222">Rep',
+            "Report two",
+        )
+    )
+
+    narratives = bedrock_integration.generate_narratives_batched(
+        {"111": findings(), "222": findings()}
+    )
+
+    assert narratives == {"111": "Report one", "222": "Report two"}
+    assert len(client.requests) == 2
+
+
+def test_failed_batch_uses_fallback_narrative(use_client):
+    use_client(FakeBedrockClient(RuntimeError("throttled")))
+
+    narratives = bedrock_integration.generate_narratives_batched(
+        {"111": findings(), "222": findings()}
+    )
+
+    fallback = bedrock_integration.generate_fallback_narrative()
+    assert narratives == {"111": fallback, "222": fallback}
+
+
+def test_accounts_are_grouped_to_fit_the_output_budget(use_client):
+    account_ids = [str(i) for i in range(bedrock_integration.BATCH_MAX_ACCOUNTS + 2)]
+    client = use_client(
+        FakeBedrockClient(
+            *[
+                "".join(
+                    f'<report account="{account_id}">Report {account_id}</report>'
+                    for account_id in account_ids
+                )
+            ]
+            * 2
+        )
+    )
+
+    narratives = bedrock_integration.generate_narratives_batched(
+        {account_id: findings() for account_id in account_ids}
+    )
+
+    assert narratives == {
+        account_id: f"Report {account_id}" for account_id in account_ids
+    }
+    assert sorted(
+        request["inferenceConfig"]["maxTokens"] for request in client.requests
+    ) == [
+        2 * bedrock_integration.BATCH_TOKENS_PER_ACCOUNT,
+        bedrock_integration.BATCH_MAX_ACCOUNTS
+        * bedrock_integration.BATCH_TOKENS_PER_ACCOUNT,
+    ]
+
+
+def test_missing_findings_use_fallback_narrative():
+    fallback = bedrock_integration.generate_fallback_narrative()
+
+    assert bedrock_integration.get_ai_analysis(FakeBedrockClient(), None) == fallback
+    assert asyncio.run(bedrock_integration.agenerate_narrative(None)) == fallback
+
+
+def race(model_ids):
+    response = asyncio.run(bedrock_integration.race_claude("prompt", model_ids))
+    return "".join(bedrock_integration.stream_narrative_claude(response))
+
+
+def test_race_uses_first_success_after_a_failure(use_aioboto3):
+    session = use_aioboto3(
+        {
+            "failing": (0, RuntimeError("throttled")),
+            "fast": (0.01, "fast report"),
+            "slow": (5, "slow report"),
+        }
+    )
+
+    assert race(("failing", "fast", "slow")) == "fast report"
+    assert session.cancelled == ["slow"]
+
+
+def test_race_raises_last_error_when_every_model_fails(use_aioboto3):
+    use_aioboto3(
+        {
+            "first": (0, RuntimeError("first failed")),
+            "second": (0.01, RuntimeError("second failed")),
+        }
+    )
+
+    with pytest.raises(RuntimeError, match="second failed"):
+        race(("first", "second"))
+
+
+def test_race_requires_model_ids(use_aioboto3):
+    use_aioboto3({})
+
+    with pytest.raises(ValueError):
+        race(())
+
+
+def test_get_ai_analysis_races_configured_models(monkeypatch, use_aioboto3):
+    monkeypatch.setenv("BEDROCK_RACE_MODEL_IDS", "slow, fast")
+    use_aioboto3({"slow": (5, "slow report"), "fast": (0, "fast report")})
+    client = FakeBedrockClient()
+
+    assert bedrock_integration.get_ai_analysis(client, findings()) == "fast report"
+    assert client.requests == []
+
+
+def test_get_ai_analysis_calls_one_model_without_aioboto3(monkeypatch):
+    monkeypatch.setenv("BEDROCK_RACE_MODEL_IDS", "slow, fast")
+    monkeypatch.setattr(bedrock_integration, "aioboto3", None)
+    client = FakeBedrockClient("single report")
+
+    assert bedrock_integration.get_ai_analysis(client, findings()) == "single report"
+    assert client.requests[0]["modelId"] == bedrock_integration.MODEL_ID
+
+
+def test_get_ai_analysis_does_not_race_inside_event_loop(monkeypatch, use_aioboto3):
+    monkeypatch.setenv("BEDROCK_RACE_MODEL_IDS", "slow, fast")
+    use_aioboto3({"slow": (5, "slow report"), "fast": (0, "fast report")})
+    client = FakeBedrockClient("single report")
+
+    async def analyze():
+        return bedrock_integration.get_ai_analysis(client, findings())
+
+    assert asyncio.run(analyze()) == "single report"
+    assert len(client.requests) == 1
+
+
+def count_prompt_findings(prompt):
+    """Split the findings in a prompt into (listed, "more", omitted) counts."""
+    listed = len(re.findall(r"^  - (?!\.\.\. and )", prompt, re.MULTILINE))
+    more = sum(map(int, re.findall(r"^  - \.\.\. and (\d+) more ", prompt, re.M)))
+    omitted = sum(map(int, re.findall(r"^\.\.\. and (\d+) additional", prompt, re.M)))
+    return listed, more, omitted
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_prompt_accounts_for_every_finding(seed):
+    rng = random.Random(seed)
+    severities = ["Critical", "High", "Medium", "Low", "Informational", None]
+    categories = [f"Category{i}" for i in range(25)]
+    findings = [
+        {
+            "severity": rng.choice(severities),
+            "category": rng.choice(categories),
+            "description": "x" * rng.choice([10, 200, 1000]),
+        }
+        for _ in range(rng.randint(0, 300))
+    ]
+
+    prompt = bedrock_integration.prepare_prompt(findings)
+
+    assert sum(count_prompt_findings(prompt)) == len(findings)
+
+
+def test_prompt_lists_more_findings_per_category():
+    prompt = bedrock_integration.prepare_prompt(findings(count=7))
+
+    assert count_prompt_findings(prompt) == (5, 2, 0)
+    assert "  - ... and 2 more IAM findings" in prompt
+    assert "additional findings omitted" not in prompt
+
+
+def test_prompt_omits_categories_beyond_the_cap():
+    extra = 3
+    prompt = bedrock_integration.prepare_prompt(
+        [
+            {"severity": "High", "category": f"Category{i}"}
+            for i in range(bedrock_integration.MAX_CATEGORIES + extra)
+        ]
+    )
+
+    assert prompt.count("Category: ") == bedrock_integration.MAX_CATEGORIES
+    assert count_prompt_findings(prompt) == (
+        bedrock_integration.MAX_CATEGORIES,
+        0,
+        extra,
+    )
+
+
+def test_prompt_size_budget_cuts_a_category_short():
+    line_chars = bedrock_integration.MAX_LINE_CHARS
+    # Five full-length findings per category, more than fit in the size budget
+    count = bedrock_integration.MAX_PROMPT_CHARS // line_chars + 10
+    prompt = bedrock_integration.prepare_prompt(
+        [
+            {
+                "severity": "High",
+                "category": f"Category{i // 5}",
+                "description": "x" * line_chars,
+            }
+            for i in range(count)
+        ]
+    )
+
+    # The last category written stops part-way, without a "more" line
+    last_category = prompt.rsplit("Category: ", 1)[1]
+    assert 0 < last_category.count("\n  - High: ") < 5
+    listed, more, omitted = count_prompt_findings(prompt)
+    assert more == 0
+    assert omitted > 0
+    assert listed + omitted == count
+    assert len(prompt) < bedrock_integration.MAX_PROMPT_CHARS + 2 * line_chars + 500
+
+
+def test_prompt_clips_oversized_lines():
+    prompt = bedrock_integration.prepare_prompt(
+        [{"severity": "High", "category": "C" * 5000, "description": "x" * 100000}]
+    )
+
+    lines = prompt.splitlines()
+    header = next(line for line in lines if line.startswith("Category: "))
+    finding = next(line for line in lines if line.startswith("  - High: "))
+    assert len(header) == len("Category: ") + bedrock_integration.MAX_LINE_CHARS
+    assert len(finding) == bedrock_integration.MAX_LINE_CHARS
+    assert header.endswith("...") and finding.endswith("...")
+    assert len(prompt) < 2000